@@ -1,11 +1,7 @@
+import crypto from 'crypto';
 import fs from 'fs';
+import os from 'os';
 import path from 'path';
-import countriesLib from 'i18n-iso-countries';
-// @ts-ignore
-import countriesGeo from 'world-countries';
-import zh from 'i18n-iso-countries/langs/zh.json';
-
-countriesLib.registerLocale(zh as any);
 
 type BracketKey =
 	| '0-500'
@@ -34,6 +30,25 @@ const ALL_BRACKETS: BracketKey[] = [
 	'10000+'
 ];
 
+const BRACKET_FILES = ALL_BRACKETS.map((bracket) => `${bracket}.txt`);
+// 监听时按文件名精确匹配，macOS 的 ._0-500.txt、编辑器备份等隐藏/杂项文件直接排除
+const BRACKET_FILE_SET = new Set(BRACKET_FILES);
+
+type CountryCacheEntry = { signature: string; counts: number[] };
+
+type BuildCache = {
+	version: string;
+	brackets: string;
+	countries: Record<string, CountryCacheEntry>;
+	inputsHash?: string;
+	dataHash?: string;
+	output?: string;
+	listing?: ListingCache;
+};
+
+// 上次列出的 地区/国家 目录结构，连同当时各目录的 mtime
+type ListingCache = { dir: string; mtime: string; regions: { name: string; mtime: string; countries: string[] }[] };
+
 type CountryAgg = {
 	code: string;
 	nameZh: string;
@@ -43,124 +58,500 @@ type CountryAgg = {
 	totals: { accounts: number };
 };
 
+type Aggregated = {
+	generatedAt: string;
+	brackets: BracketKey[];
+	totals: { accounts: number };
+	countries: CountryAgg[];
+	regions: string[];
+};
+
+// 数据目录不存在时（如 CI 部署预览）写出的示例数据
+const SAMPLE_COUNTRIES: CountryAgg[] = [
+	{
+		code: 'GB',
+		nameZh: '英国',
+		region: 'EU',
+		centroid: [-3.436, 55.378],
+		byBracket: { '0-500': 15000, '500-1000': 12000, '1000-2000': 10000, '2000-3000': 8000, '10000+': 6544 },
+		totals: { accounts: 51544 }
+	},
+	{
+		code: 'PK',
+		nameZh: '巴基斯坦',
+		region: '东南亚',
+		centroid: [69.345, 30.375],
+		byBracket: { '0-500': 8000, '500-1000': 5000, '1000-2000': 4000, '2000-3000': 2000, '10000+': 1181 },
+		totals: { accounts: 20181 }
+	},
+	{
+		code: 'NL',
+		nameZh: '荷兰',
+		region: 'EU',
+		centroid: [5.291, 52.132],
+		byBracket: { '0-500': 4000, '500-1000': 2500, '1000-2000': 1500, '2000-3000': 800, '10000+': 241 },
+		totals: { accounts: 9041 }
+	},
+	{
+		code: 'AU',
+		nameZh: '澳大利亚',
+		region: '东南亚',
+		centroid: [133.775, -25.274],
+		byBracket: { '0-500': 4000, '500-1000': 2400, '1000-2000': 1500, '2000-3000': 800, '10000+': 272 },
+		totals: { accounts: 8972 }
+	},
+	{
+		code: 'FR',
+		nameZh: '法国',
+		region: 'EU',
+		centroid: [2.213, 46.227],
+		byBracket: { '0-500': 3500, '500-1000': 2200, '1000-2000': 1500, '2000-3000': 900, '10000+': 430 },
+		totals: { accounts: 8530 }
+	},
+	{
+		code: 'IQ',
+		nameZh: '伊拉克',
+		region: '中东',
+		centroid: [43.679, 33.223],
+		byBracket: { '0-500': 3500, '500-1000': 2000, '1000-2000': 1400, '2000-3000': 900, '10000+': 320 },
+		totals: { accounts: 8120 }
+	},
+	{
+		code: 'TR',
+		nameZh: '土耳其',
+		region: '东南亚',
+		centroid: [35.243, 38.963],
+		byBracket: { '0-500': 3000, '500-1000': 1800, '1000-2000': 1200, '2000-3000': 800, '10000+': 321 },
+		totals: { accounts: 7121 }
+	},
+	{
+		code: 'SA',
+		nameZh: '沙特阿拉伯',
+		region: '中东',
+		centroid: [45.079, 23.885],
+		byBracket: { '0-500': 3000, '500-1000': 1700, '1000-2000': 1200, '2000-3000': 800, '10000+': 361 },
+		totals: { accounts: 7061 }
+	}
+];
+
 const ROOT = path.resolve(__dirname, '..');
-const DATA_DIR = process.env.DATA_DIR || path.resolve(ROOT, '..', '粉丝分类');
+// 启动时规范化一次（绝对路径、无末尾分隔符），之后的子路径都直接拼接
+const DATA_DIR = process.env.DATA_DIR ? path.resolve(process.env.DATA_DIR) : path.resolve(ROOT, '..', '粉丝分类');
 const OUTPUT = path.resolve(ROOT, 'public/data/aggregated.json');
+const CACHE_FILE = path.resolve(ROOT, '.cache/build-data.json');
+// 写 aggregated.json 用的临时文件放在已忽略的 .cache 下：中途被杀掉时不会留在 public/ 里被打包部署。
+// 与 OUTPUT 同在项目目录内、同一文件系统，rename 仍是原子的
+const OUTPUT_TMP = path.resolve(ROOT, '.cache/aggregated.json.tmp');
+// 统计或聚合逻辑有改动时递增，让旧缓存整体作废
+const CACHE_VERSION = 1;
+const WATCH = process.argv.includes('--watch');
 
-function readLines(file: string): string[] {
+// 网络文件系统（NFS/CIFS/SMB）不会投递 inotify 事件，只能退回轮询
+const NETWORK_FS_TYPES = new Set([0x6969, 0xff534d42, 0xfe534d42, 0x517b]);
+const POLL_INTERVAL_MS = 2000;
+const DEBOUNCE_MS = 1000;
+const DEBOUNCE_MAX_WAIT_MS = 5000;
+const STAT_BATCH_SIZE = 4096;
+const DEEP_SCAN_EVERY = 10;
+const WRITE_CHUNK_SIZE = 1 << 16;
+const READ_CHUNK_SIZE = 1 << 20;
+// os.cpus() 在没有 /proc 等环境下可能返回空数组，用 availableParallelism 并保证至少为 1
+const READ_CONCURRENCY = Math.max(1, Math.min(32, os.availableParallelism() * 4));
+const LISTING_REVALIDATE_RATE = 1 / 20;
+
+// 按字节统计有效账号行数，结果与 trim 后过滤空行和 '#' 注释行一致，但不为每一行创建字符串。
+// 行首是非 ASCII 字节时（BOM、全角空格等）才解码该行，交给 trimStart 判断
+function countAccountLines(buf: Buffer): number {
+	let count = 0;
+	let start = 0;
+	while (start < buf.length) {
+		let end = buf.indexOf(0x0a, start);
+		if (end === -1) end = buf.length;
+		let i = start;
+		while (i < end && (buf[i] === 0x20 || (buf[i] >= 0x09 && buf[i] <= 0x0d))) i++;
+		if (i < end && buf[i] !== 0x23) {
+			if (buf[i] < 0x80) {
+				count++;
+			} else {
+				const rest = buf.toString('utf-8', i, end).trimStart();
+				if (rest.length > 0 && !rest.startsWith('#')) count++;
+			}
+		}
+		start = end + 1;
+	}
+	return count;
+}
+
+// 小文件一次读入；大文件用一块复用的缓冲区分段读取，只把最后一行不完整的部分挪到下一段开头，
+// 避免把整个文件读进内存
+async function countAccounts(file: string, size: number): Promise<number> {
 	try {
-		const raw = fs.readFileSync(file, 'utf-8');
-		return raw
-			.split(/\r?\n/)
-			.map((l) => l.trim())
-			.filter((l) => l.length > 0 && !l.startsWith('#'));
+		if (size <= READ_CHUNK_SIZE) return countAccountLines(await fs.promises.readFile(file));
+
+		const handle = await fs.promises.open(file, 'r');
+		try {
+			let buf = Buffer.allocUnsafe(READ_CHUNK_SIZE);
+			let count = 0;
+			let carry = 0;
+			for (;;) {
+				if (carry === buf.length) {
+					// 单行比缓冲区还长，只能扩容
+					const bigger = Buffer.allocUnsafe(buf.length * 2);
+					buf.copy(bigger, 0, 0, carry);
+					buf = bigger;
+				}
+				const { bytesRead } = await handle.read(buf, carry, buf.length - carry, null);
+				const end = carry + bytesRead;
+				if (bytesRead === 0) return count + countAccountLines(buf.subarray(0, end));
+
+				const lastNewline = buf.lastIndexOf(0x0a, end - 1);
+				if (lastNewline < 0) {
+					carry = end;
+					continue;
+				}
+				count += countAccountLines(buf.subarray(0, lastNewline + 1));
+				carry = buf.copy(buf, 0, lastNewline + 1, end);
+			}
+		} finally {
+			await handle.close();
+		}
 	} catch {
-		return [];
+		return 0;
 	}
 }
 
-function getCentroid(code: string): [number, number] {
+// 以固定并发数跑完所有任务，结果顺序与输入一致
+async function mapConcurrent<T, R>(items: T[], limit: number, fn: (item: T, index: number) => Promise<R>): Promise<R[]> {
+	const results = new Array<R>(items.length);
+	let next = 0;
+	const worker = async () => {
+		while (next < items.length) {
+			const i = next++;
+			results[i] = await fn(items[i], i);
+		}
+	};
+	await Promise.all(Array.from({ length: Math.min(Math.max(1, limit), items.length) }, worker));
+	return results;
+}
+
+let buildCache: BuildCache | undefined;
+
+// 只读 package.json 取版本号，不加载库本身
+function dependencyVersion(name: string): string {
+	try {
+		return JSON.parse(fs.readFileSync(path.resolve(ROOT, 'node_modules', name, 'package.json'), 'utf-8')).version ?? '';
+	} catch {
+		return '';
+	}
+}
+
+// 缓存里的计数、输入/输出签名都依赖脚本本身的逻辑和国家库的数据，任一变化都视为没有缓存
+function cacheVersion(): string {
+	return [CACHE_VERSION, `i18n-iso-countries@${dependencyVersion('i18n-iso-countries')}`, `world-countries@${dependencyVersion('world-countries')}`].join('|');
+}
+
+function loadCache(): BuildCache {
+	const empty: BuildCache = { version: cacheVersion(), brackets: ALL_BRACKETS.join(','), countries: {} };
+	try {
+		const cache = JSON.parse(fs.readFileSync(CACHE_FILE, 'utf-8')) as BuildCache;
+		return cache.version === empty.version && cache.brackets === empty.brackets && cache.countries ? cache : empty;
+	} catch {
+		return empty;
+	}
+}
+
+function saveCache(cache: BuildCache) {
 	try {
-		const feature: any = (countriesGeo as any[]).find((c) => c.cca2 === code);
-		if (!feature) return [0, 0];
-		const latlng = feature.latlng as [number, number] | undefined;
-		if (latlng && latlng.length === 2) {
-			const [lat, lng] = latlng;
-			return [lng, lat];
+		const fd = openForWrite(CACHE_FILE);
+		try {
+			// 缓存只给脚本自己读，不缩进
+			fs.writeFileSync(fd, JSON.stringify(cache), 'utf-8');
+		} finally {
+			fs.closeSync(fd);
 		}
-	} catch {}
-	return [0, 0];
+	} catch (err) {
+		console.warn('写入缓存失败:', err);
+	}
 }
 
-function getNameZh(code: string): string {
+type CountryScan = {
+	countryDir: string;
+	signature: string;
+	files: { file: string; stat?: fs.BigIntStats }[];
+};
+
+// 以各区间文件的 mtime 和大小作为国家目录的签名，只 stat 不读取
+async function scanCountry(countryDir: string): Promise<CountryScan> {
+	// countryDir 已经是规范化的路径，直接拼接文件名即可，不必再走 path.join
+	const files = await Promise.all(
+		BRACKET_FILES.map(async (name) => {
+			const file = `${countryDir}${path.sep}${name}`;
+			try {
+				return { file, stat: await fs.promises.stat(file, { bigint: true }) };
+			} catch {
+				return { file, stat: undefined };
+			}
+		})
+	);
+	const signature = files.map(({ stat }) => (stat ? `${stat.mtimeNs}:${stat.size}` : '-')).join(',');
+	return { countryDir, signature, files };
+}
+
+// 整棵目录树的输入签名：地区列表加上每个国家目录的签名
+function inputsHash(regions: string[], scans: CountryScan[]): string {
+	const hash = crypto.createHash('sha1');
+	hash.update(regions.join('\0'));
+	for (const { countryDir, signature } of scans) hash.update(`\n${countryDir}\0${signature}`);
+	return hash.digest('hex');
+}
+
+// 签名不变的国家直接复用上次的统计结果，不再读取文件。
+// 需要重新统计的文件一起并发读取，每个 (国家, 区间) 是一个独立任务
+async function countCountries(scans: CountryScan[], prev: BuildCache, next: BuildCache): Promise<number[][]> {
+	const reads: { counts: number[]; index: number; file: string; size: number }[] = [];
+	const results = scans.map(({ countryDir, signature, files }) => {
+		const cached = prev.countries[countryDir];
+		let counts: number[];
+		if (cached?.signature === signature) {
+			counts = cached.counts;
+		} else {
+			counts = new Array(ALL_BRACKETS.length).fill(0);
+			files.forEach(({ file, stat }, index) => {
+				if (stat) reads.push({ counts, index, file, size: Number(stat.size) });
+			});
+		}
+		next.countries[countryDir] = { signature, counts };
+		return counts;
+	});
+
+	await mapConcurrent(reads, READ_CONCURRENCY, async ({ counts, index, file, size }) => {
+		counts[index] = await countAccounts(file, size);
+	});
+	return results;
+}
+
+// 逐字段增量喂给哈希，不需要先把整份结果序列化成 JSON 字符串。
+// 输出里的每个字段都要参与，包括来自国家库的中文名和坐标，否则库更新后会误判为无变化
+function dataHash(countries: CountryAgg[], regions: string[]): string {
+	const hash = crypto.createHash('sha1');
+	hash.update(regions.join('\0'));
+	for (const c of countries) {
+		hash.update(`\n${c.code}\0${c.nameZh}\0${c.region}\0${c.centroid[0]}\0${c.centroid[1]}\0${c.totals.accounts}`);
+		for (const bracket of ALL_BRACKETS) hash.update(`\0${c.byBracket[bracket] ?? 0}`);
+	}
+	return hash.digest('hex');
+}
+
+function outputSignature(): string | undefined {
 	try {
-		const name = countriesLib.getName(code, 'zh');
-		if (name) return name;
-	} catch {}
-	return code;
+		const stat = fs.statSync(OUTPUT, { bigint: true });
+		return `${stat.mtimeNs}:${stat.size}`;
+	} catch {
+		return undefined;
+	}
+}
+
+let countriesLib: any;
+let countriesGeo: any[] = [];
+let countryLibs: Promise<void> | undefined;
+let centroidIndex: Map<string, [number, number]> | undefined;
+const nameZhCache = new Map<string, string>();
+
+// 国家名称/坐标库只在真正要聚合时才加载：写示例数据、输入无变化这两条路径都用不到，
+// 省掉启动时解析 world-countries 整张表的开销。getCentroid/getNameZh 之前须先等它完成
+function loadCountryLibs(): Promise<void> {
+	countryLibs ??= Promise.all([
+		import('i18n-iso-countries'),
+		// @ts-ignore
+		import('world-countries'),
+		import('i18n-iso-countries/langs/zh.json')
+	]).then(
+		([lib, geo, zh]) => {
+			lib.default.registerLocale(zh.default as any);
+			countriesLib = lib.default;
+			countriesGeo = geo.default;
+		},
+		(err) => {
+			countryLibs = undefined;
+			throw err;
+		}
+	);
+	return countryLibs;
+}
+
+// world-countries 第一次用到时按 cca2 建索引，之后每个国家都是一次 Map 查找而不是线性扫描整张表
+function getCentroid(code: string): [number, number] {
+	centroidIndex ??= new Map(
+		countriesGeo
+			.filter((c) => Array.isArray(c.latlng) && c.latlng.length === 2)
+			.map((c): [string, [number, number]] => [c.cca2, [c.latlng[1], c.latlng[0]]])
+	);
+	return centroidIndex.get(code) ?? [0, 0];
+}
+
+function getNameZh(code: string): string {
+	let name = nameZhCache.get(code);
+	if (name === undefined) {
+		try {
+			name = countriesLib.getName(code, 'zh') || code;
+		} catch {
+			name = code;
+		}
+		nameZhCache.set(code, name);
+	}
+	return name;
 }
 
 function ensureDir(dir: string) {
 	fs.mkdirSync(dir, { recursive: true });
 }
 
-function main() {
-	if (!fs.existsSync(DATA_DIR)) {
+// 直接打开文件，只有父目录不存在时才去创建，省掉每次写入前的 mkdir
+function openForWrite(file: string): number {
+	try {
+		return fs.openSync(file, 'w');
+	} catch (err: any) {
+		if (err?.code !== 'ENOENT') throw err;
+		ensureDir(path.dirname(file));
+		return fs.openSync(file, 'w');
+	}
+}
+
+// 同上：目标目录（如全新检出时的 public/data）不存在时才创建
+function renameInto(from: string, to: string) {
+	try {
+		fs.renameSync(from, to);
+	} catch (err: any) {
+		if (err?.code !== 'ENOENT') throw err;
+		ensureDir(path.dirname(to));
+		fs.renameSync(from, to);
+	}
+}
+
+function indentJson(value: unknown, indent: string): string {
+	return JSON.stringify(value, null, 2).replace(/\n/g, `\n${indent}`);
+}
+
+// 逐个国家序列化写出，不在内存里拼出整份 JSON；输出格式与 JSON.stringify(data, null, 2) 相同。
+// 先写临时文件再 rename，读取方不会读到写了一半的文件
+function writeAggregated(data: Aggregated) {
+	const tmp = OUTPUT_TMP;
+	const fd = openForWrite(tmp);
+	// fd 只在 finally 里关闭一次；写入、关闭或 rename 任一步失败都删掉临时文件
+	try {
+		try {
+			let pending = '';
+			const write = (chunk: string) => {
+				pending += chunk;
+				if (pending.length >= WRITE_CHUNK_SIZE) {
+					fs.writeSync(fd, pending);
+					pending = '';
+				}
+			};
+
+			write(`{\n  "generatedAt": ${JSON.stringify(data.generatedAt)},\n`);
+			write(`  "brackets": ${indentJson(data.brackets, '  ')},\n`);
+			write(`  "totals": ${indentJson(data.totals, '  ')},\n`);
+			if (data.countries.length === 0) {
+				write('  "countries": [],\n');
+			} else {
+				write('  "countries": [\n');
+				data.countries.forEach((c, i) => write(`${i ? ',\n' : ''}    ${indentJson(c, '    ')}`));
+				write('\n  ],\n');
+			}
+			write(`  "regions": ${indentJson(data.regions, '  ')}\n}`);
+			fs.writeSync(fd, pending);
+		} finally {
+			fs.closeSync(fd);
+		}
+		renameInto(tmp, OUTPUT);
+	} catch (err) {
+		fs.rmSync(tmp, { force: true });
+		throw err;
+	}
+}
+
+type CountryDir = { regionName: string; code: string; countryDir: string };
+
+type CountryListing = {
+	regionNames: string[];
+	regionDirs: string[];
+	countries: CountryDir[];
+	cache: ListingCache;
+	// 本次是否真的重新 readdir 过（缓存需要写回）
+	refreshed: boolean;
+};
+
+// 一次列出 地区/国家 两层目录，目录类型直接取自 readdir 的 dirent，不再逐项 stat。
+// 各地区目录互不相关，并发处理，在高延迟存储（SMB、SSHFS 等）上能同时挂起多次往返。
+// 目录的 mtime 只在直接子项增删/改名时变化：和上次缓存的 mtime 相同就沿用上次的列表，只花一次 stat。
+// mtime 精度粗的文件系统（FAT、部分 NFS）可能漏掉同一时刻内的变化，所以按 LISTING_REVALIDATE_RATE 的概率整体重新列出。
+// 数据目录不存在时返回 null：直接以 stat 的 ENOENT 判断，不另外探测一次
+async function listCountryDirs(cached?: ListingCache): Promise<CountryListing | null> {
+	const usable = cached?.dir === DATA_DIR && Math.random() >= LISTING_REVALIDATE_RATE ? cached : undefined;
+	let refreshed = false;
+	let rootMtime: string;
+	let regionNames: string[];
+	try {
+		// 先取 mtime 再 readdir：列出期间发生的变化会让下一次比较不相等
+		rootMtime = String((await fs.promises.stat(DATA_DIR, { bigint: true })).mtimeNs);
+		if (usable?.mtime === rootMtime) {
+			regionNames = usable.regions.map((region) => region.name);
+		} else {
+			const regionEntries = await fs.promises.readdir(DATA_DIR, { withFileTypes: true });
+			regionNames = regionEntries.filter((region) => region.isDirectory()).map((region) => region.name);
+			refreshed = true;
+		}
+	} catch (err: any) {
+		if (err?.code === 'ENOENT') return null;
+		throw err;
+	}
+
+	const cachedRegions = new Map(usable?.regions.map((region) => [region.name, region]));
+	const regionDirs = regionNames.map((regionName) => `${DATA_DIR}${path.sep}${regionName}`);
+	const regions = await mapConcurrent(regionNames, READ_CONCURRENCY, async (name, i): Promise<ListingCache['regions'][number]> => {
+		const regionDir = regionDirs[i];
+		try {
+			const mtime = String((await fs.promises.stat(regionDir, { bigint: true })).mtimeNs);
+			const hit = cachedRegions.get(name);
+			if (hit?.mtime === mtime) return hit;
+			const entries = await fs.promises.readdir(regionDir, { withFileTypes: true });
+			refreshed = true;
+			return { name, mtime, countries: entries.filter((country) => country.isDirectory()).map((country) => country.name) };
+		} catch {
+			// 空 mtime 不会和任何真实值相等，下次一定重新列出
+			return { name, mtime: '', countries: [] };
+		}
+	});
+
+	const countries = regions.flatMap((region, i) =>
+		region.countries.map((code): CountryDir => ({ regionName: region.name, code, countryDir: `${regionDirs[i]}${path.sep}${code}` }))
+	);
+	return { regionNames, regionDirs, countries, cache: { dir: DATA_DIR, mtime: rootMtime, regions }, refreshed };
+}
+
+type BuildInputs = { regionNames: string[]; countryDirs: CountryDir[]; scans: CountryScan[]; hash: string; listing: CountryListing };
+
+// 列目录并 stat 全部区间文件，得到本次构建的输入及其签名；各国家目录的 stat 同样并发进行
+async function scanInputs(): Promise<BuildInputs | null> {
+	const listing = await listCountryDirs((buildCache ??= loadCache()).listing);
+	if (!listing) return null;
+	const { regionNames, countries } = listing;
+	const scans = await mapConcurrent(countries, READ_CONCURRENCY, (c) => scanCountry(c.countryDir));
+	return { regionNames, countryDirs: countries, scans, hash: inputsHash(regionNames, scans), listing };
+}
+
+async function build(inputs?: BuildInputs | null): Promise<void> {
+	if (inputs === undefined) inputs = await scanInputs();
+	if (!inputs) {
 		console.warn('数据目录不存在:', DATA_DIR);
 		console.log('生成示例数据用于部署预览...');
 		
-		// 生成示例数据
-		const sampleCountries: CountryAgg[] = [
-			{
-				code: 'GB',
-				nameZh: '英国',
-				region: 'EU',
-				centroid: [-3.436, 55.378],
-				byBracket: { '0-500': 15000, '500-1000': 12000, '1000-2000': 10000, '2000-3000': 8000, '10000+': 6544 },
-				totals: { accounts: 51544 }
-			},
-			{
-				code: 'PK',
-				nameZh: '巴基斯坦',
-				region: '东南亚',
-				centroid: [69.345, 30.375],
-				byBracket: { '0-500': 8000, '500-1000': 5000, '1000-2000': 4000, '2000-3000': 2000, '10000+': 1181 },
-				totals: { accounts: 20181 }
-			},
-			{
-				code: 'NL',
-				nameZh: '荷兰',
-				region: 'EU',
-				centroid: [5.291, 52.132],
-				byBracket: { '0-500': 4000, '500-1000': 2500, '1000-2000': 1500, '2000-3000': 800, '10000+': 241 },
-				totals: { accounts: 9041 }
-			},
-			{
-				code: 'AU',
-				nameZh: '澳大利亚',
-				region: '东南亚',
-				centroid: [133.775, -25.274],
-				byBracket: { '0-500': 4000, '500-1000': 2400, '1000-2000': 1500, '2000-3000': 800, '10000+': 272 },
-				totals: { accounts: 8972 }
-			},
-			{
-				code: 'FR',
-				nameZh: '法国',
-				region: 'EU',
-				centroid: [2.213, 46.227],
-				byBracket: { '0-500': 3500, '500-1000': 2200, '1000-2000': 1500, '2000-3000': 900, '10000+': 430 },
-				totals: { accounts: 8530 }
-			},
-			{
-				code: 'IQ',
-				nameZh: '伊拉克',
-				region: '中东',
-				centroid: [43.679, 33.223],
-				byBracket: { '0-500': 3500, '500-1000': 2000, '1000-2000': 1400, '2000-3000': 900, '10000+': 320 },
-				totals: { accounts: 8120 }
-			},
-			{
-				code: 'TR',
-				nameZh: '土耳其',
-				region: '东南亚',
-				centroid: [35.243, 38.963],
-				byBracket: { '0-500': 3000, '500-1000': 1800, '1000-2000': 1200, '2000-3000': 800, '10000+': 321 },
-				totals: { accounts: 7121 }
-			},
-			{
-				code: 'SA',
-				nameZh: '沙特阿拉伯',
-				region: '中东',
-				centroid: [45.079, 23.885],
-				byBracket: { '0-500': 3000, '500-1000': 1700, '1000-2000': 1200, '2000-3000': 800, '10000+': 361 },
-				totals: { accounts: 7061 }
-			}
-		];
-		
+		const sampleCountries = SAMPLE_COUNTRIES.slice();
 		const totalAccounts = sampleCountries.reduce((s, c) => s + c.totals.accounts, 0);
 		const regions = Array.from(new Set(sampleCountries.map(c => c.region)));
 		
-		const sampleData = {
+		const sampleData: Aggregated = {
 			generatedAt: new Date().toISOString(),
 			brackets: ALL_BRACKETS,
 			totals: { accounts: totalAccounts },
@@ -168,8 +559,7 @@ function main() {
 			regions: regions
 		};
 		
-		ensureDir(path.dirname(OUTPUT));
-		fs.writeFileSync(OUTPUT, JSON.stringify(sampleData, null, 2), 'utf-8');
+		writeAggregated(sampleData);
 		console.log('示例数据文件已生成:', OUTPUT);
 		console.log(`总计: ${totalAccounts} 个账号, ${sampleCountries.length} 个国家, ${regions.length} 个区域`);
 		return;
@@ -177,59 +567,348 @@ function main() {
 
 	const countryAggMap = new Map<string, CountryAgg>();
 	const regions = new Set<string>();
+	const prevCache = (buildCache ??= loadCache());
 
-	const regionDirs = fs
-		.readdirSync(DATA_DIR, { withFileTypes: true })
-		.filter((d) => d.isDirectory())
-		.map((d) => d.name);
-
-	for (const regionName of regionDirs) {
-		regions.add(regionName);
-		const regionDir = path.join(DATA_DIR, regionName);
-		
-		const countries = fs
-			.readdirSync(regionDir, { withFileTypes: true })
-			.filter((d) => d.isDirectory())
-			.map((d) => d.name);
-
-		for (const code of countries) {
-			const countryDir = path.join(regionDir, code);
-			const agg: CountryAgg = countryAggMap.get(code) ?? {
-				code,
-				nameZh: getNameZh(code),
-				region: regionName,
-				centroid: getCentroid(code),
-				byBracket: {},
-				totals: { accounts: 0 }
-			};
-
-			for (const bracket of ALL_BRACKETS) {
-				const file = path.join(countryDir, `${bracket}.txt`);
-				const lines = fs.existsSync(file) ? readLines(file) : [];
-				agg.byBracket[bracket] = (agg.byBracket[bracket] ?? 0) + lines.length;
-				agg.totals.accounts += lines.length;
-			}
+	const { regionNames, countryDirs, scans, hash, listing } = inputs;
+	const nextCache: BuildCache = { version: prevCache.version, brackets: prevCache.brackets, countries: {}, listing: listing.cache };
+	for (const regionName of regionNames) regions.add(regionName);
 
-			countryAggMap.set(code, agg);
+	// 所有输入文件的 mtime/大小都和上次一样、输出文件也没被改动时，连聚合都不用做
+	nextCache.inputsHash = hash;
+	if (prevCache.inputsHash === nextCache.inputsHash && prevCache.output !== undefined && prevCache.output === outputSignature()) {
+		// 目录结构重新列出过时仍要把新的 mtime 记下来，否则下次还得再列一遍
+		if (listing.refreshed) {
+			prevCache.listing = listing.cache;
+			saveCache(prevCache);
 		}
+		console.log('输入文件无变化，跳过聚合:', OUTPUT);
+		return;
 	}
 
-	const countries = Array.from(countryAggMap.values());
+	// 库的加载和读区间文件互不依赖，同时进行
+	const [countsList] = await Promise.all([countCountries(scans, prevCache, nextCache), loadCountryLibs()]);
+
+	countryDirs.forEach(({ regionName, code }, i) => {
+		const agg: CountryAgg = countryAggMap.get(code) ?? {
+			code,
+			nameZh: getNameZh(code),
+			region: regionName,
+			centroid: getCentroid(code),
+			byBracket: {},
+			totals: { accounts: 0 }
+		};
+
+		ALL_BRACKETS.forEach((bracket, j) => {
+			agg.byBracket[bracket] = (agg.byBracket[bracket] ?? 0) + countsList[i][j];
+			agg.totals.accounts += countsList[i][j];
+		});
+
+		countryAggMap.set(code, agg);
+	});
+
+	const countries = Array.from(countryAggMap.values()).sort((a, b) => b.totals.accounts - a.totals.accounts);
 	const totalAccounts = countries.reduce((s, c) => s + c.totals.accounts, 0);
+	const regionList = Array.from(regions);
+
+	// 统计结果和上次写出的完全一致且输出文件没被改动过时，保留原文件（包括 generatedAt）
+	nextCache.dataHash = dataHash(countries, regionList);
+	buildCache = nextCache;
+	if (prevCache.dataHash === nextCache.dataHash && prevCache.output !== undefined && prevCache.output === outputSignature()) {
+		nextCache.output = prevCache.output;
+		saveCache(nextCache);
+		console.log('数据无变化，跳过写入:', OUTPUT);
+		return;
+	}
 
-	const out = {
+	writeAggregated({
 		generatedAt: new Date().toISOString(),
 		brackets: ALL_BRACKETS,
 		totals: { accounts: totalAccounts },
-		countries: countries.sort((a, b) => b.totals.accounts - a.totals.accounts),
-		regions: Array.from(regions)
-	};
-
-	ensureDir(path.dirname(OUTPUT));
-	fs.writeFileSync(OUTPUT, JSON.stringify(out, null, 2), 'utf-8');
+		countries,
+		regions: regionList
+	});
+	nextCache.output = outputSignature();
+	saveCache(nextCache);
 	console.log('数据聚合完成:', OUTPUT);
 	console.log(`总计: ${totalAccounts} 个账号, ${countries.length} 个国家, ${regions.size} 个区域`);
 }
 
-main();
+function isNetworkFs(dir: string): boolean {
+	try {
+		return NETWORK_FS_TYPES.has(Number(fs.statfsSync(dir).type));
+	} catch {
+		return false;
+	}
+}
+
+// 事件驱动监听：只监听国家目录里的区间文件变化，根目录和地区目录只用来发现新增/删除的子目录
+async function watchWithEvents(onChange: () => void, signal: AbortSignal): Promise<void> {
+	let watchers: fs.FSWatcher[] = [];
+	let generation = 0;
+	const closeAll = () => {
+		for (const w of watchers) w.close();
+		watchers = [];
+	};
+
+	// 列目录是异步的，连续触发时只让最后一次挂载生效
+	const attach = async () => {
+		const current = ++generation;
+		const listing = await listCountryDirs();
+		if (current !== generation) return;
+		closeAll();
+		if (signal.aborted) return;
+
+		const onDirChange = () => {
+			attach().catch((err) => console.error('重新挂载监听失败:', err));
+			onChange();
+		};
+		const onFileChange = (_event: string, filename: string | null) => {
+			if (!filename || BRACKET_FILE_SET.has(filename)) onChange();
+		};
+		const watchDir = (dir: string, listener: (event: string, filename: string | null) => void) => {
+			let w: fs.FSWatcher;
+			try {
+				w = fs.watch(dir, listener);
+			} catch (err: any) {
+				// 目录在列出之后被删掉了，等上级目录的事件重新挂载
+				if (err?.code === 'ENOENT') return;
+				throw err;
+			}
+			w.on('error', onDirChange);
+			watchers.push(w);
+		};
+
+		const { regionDirs, countries } = listing ?? { regionDirs: [], countries: [] };
+		watchDir(DATA_DIR, onDirChange);
+		for (const regionDir of regionDirs) watchDir(regionDir, onDirChange);
+		for (const { countryDir } of countries) watchDir(countryDir, onFileChange);
+	};
+
+	try {
+		await attach();
+	} catch (err) {
+		closeAll();
+		throw err;
+	}
+	signal.addEventListener('abort', closeAll);
+}
+
+// mtimes 与 files 一一对应，连续的 int64 数组，每轮原地覆盖
+type DirState = { mtime: bigint; subdirs: string[]; files: string[]; mtimes?: BigInt64Array };
+
+// 目录项类型直接取自 readdir 返回的 dirent，不需要逐项 stat
+// depth 与构建时的目录结构一致：0 为数据根目录、1 为地区、2 为国家。
+// 根目录和地区目录只记子目录，国家目录只记区间文件，更深的目录构建用不到，也不再往下走
+function readDirState(dir: string, mtime: bigint, depth: number): DirState | null {
+	let entries: fs.Dirent[];
+	try {
+		entries = fs.readdirSync(dir, { withFileTypes: true });
+	} catch {
+		return null;
+	}
+	// dir 来自已规范化的 DATA_DIR，直接拼接，只为保留下来的目录项构造路径
+	const state: DirState = { mtime, subdirs: [], files: [] };
+	for (const entry of entries) {
+		if (depth < 2) {
+			if (entry.isDirectory()) state.subdirs.push(`${dir}${path.sep}${entry.name}`);
+		} else if (BRACKET_FILE_SET.has(entry.name) && entry.isFile()) {
+			state.files.push(`${dir}${path.sep}${entry.name}`);
+		}
+	}
+	return state;
+}
+
+// 成批并发提交 stat，由 libuv 线程池并行执行，在网络文件系统上能把往返延迟重叠起来。
+// 结果直接与各目录的 mtime 表比较并原地写回，返回是否有文件 mtime 变化
+async function refreshMtimes(states: DirState[]): Promise<boolean> {
+	let changed = false;
+	const targets: [BigInt64Array, number, string][] = [];
+	for (const state of states) {
+		if (state.mtimes?.length !== state.files.length) state.mtimes = new BigInt64Array(state.files.length).fill(-1n);
+		state.files.forEach((file, i) => targets.push([state.mtimes!, i, file]));
+	}
+	const apply = ([mtimes, i]: [BigInt64Array, number, string], mtime: bigint) => {
+		if (mtimes[i] !== mtime) {
+			mtimes[i] = mtime;
+			changed = true;
+		}
+	};
+
+	if (targets.length === 1) {
+		let mtime = -1n;
+		try {
+			mtime = fs.statSync(targets[0][2], { bigint: true }).mtimeNs;
+		} catch {}
+		apply(targets[0], mtime);
+		return changed;
+	}
+	for (let i = 0; i < targets.length; i += STAT_BATCH_SIZE) {
+		const batch = targets.slice(i, i + STAT_BATCH_SIZE);
+		const results = await Promise.allSettled(batch.map(([, , file]) => fs.promises.stat(file, { bigint: true })));
+		results.forEach((r, j) => apply(batch[j], r.status === 'fulfilled' ? r.value.mtimeNs : -1n));
+	}
+	return changed;
+}
+
+function sameList(a: string[], b: string[]): boolean {
+	return a.length === b.length && a.every((v, i) => v === b[i]);
+}
+
+// 轮询监听：inotify 不可用时的后备方案
+async function watchWithPolling(onChange: () => void, signal: AbortSignal): Promise<void> {
+	const dirStates = new Map<string, DirState>();
+	let tick = 0;
+	let scanning = false;
+
+	// 目录 mtime 只在直接子项增删/改名时变化：目录没变就不必重新列出，也不必 stat 其中的文件。
+	// 原地改写文件内容不会更新目录 mtime，所以每隔几轮对所有目录的文件重新 stat 一次兜底
+	const scan = async (deep: boolean): Promise<boolean> => {
+		let changed = false;
+		const toRefresh: DirState[] = [];
+		const seenDirs = new Set<string>();
+		const stack: [string, number][] = [[DATA_DIR, 0]];
+		let top: [string, number] | undefined;
+		while ((top = stack.pop()) !== undefined) {
+			const [dir, depth] = top;
+			let mtime: bigint;
+			try {
+				mtime = fs.statSync(dir, { bigint: true }).mtimeNs;
+			} catch {
+				continue;
+			}
+			seenDirs.add(dir);
+			let state = dirStates.get(dir);
+			if (!state || state.mtime !== mtime) {
+				const fresh = readDirState(dir, mtime, depth);
+				if (!fresh) continue;
+				if (state && sameList(state.subdirs, fresh.subdirs) && sameList(state.files, fresh.files)) fresh.mtimes = state.mtimes;
+				else changed = true;
+				dirStates.set(dir, (state = fresh));
+				toRefresh.push(state);
+			} else if (deep) {
+				toRefresh.push(state);
+			}
+			for (const subdir of state.subdirs) stack.push([subdir, depth + 1]);
+		}
+		for (const known of dirStates.keys()) {
+			if (!seenDirs.has(known)) dirStates.delete(known);
+		}
+
+		if (await refreshMtimes(toRefresh)) changed = true;
+		return changed;
+	};
+
+	await scan(true);
+	if (signal.aborted) return;
+
+	const interval = setInterval(async () => {
+		if (scanning) return;
+		scanning = true;
+		try {
+			tick++;
+			if (await scan(tick % DEEP_SCAN_EVERY === 0)) onChange();
+		} finally {
+			scanning = false;
+		}
+	}, POLL_INTERVAL_MS);
+	signal.addEventListener('abort', () => clearInterval(interval));
+}
+
+async function watch() {
+	const controller = new AbortController();
+	const { signal } = controller;
+	let timer: NodeJS.Timeout | undefined;
+	let building = false;
+	let pending = false;
+	let lastInputsHash: string | undefined;
+
+	// 同一时间只跑一次 build，期间的变化合并成结束后的一次重跑。
+	// 编辑器临时文件、重复事件等不改变任何区间文件 mtime/大小的唤醒，只花一轮 stat 就直接忽略
+	const rebuild = async (initial = false) => {
+		if (building) {
+			pending = true;
+			return;
+		}
+		building = true;
+		try {
+			do {
+				pending = false;
+				try {
+					const inputs = await scanInputs();
+					if (!inputs) {
+						console.warn('数据目录不存在:', DATA_DIR);
+						continue;
+					}
+					if (inputs.hash === lastInputsHash) continue;
+					if (!initial) console.log('检测到数据变化，重新生成...');
+					initial = false;
+					await build(inputs);
+					lastInputsHash = inputs.hash;
+				} catch (err) {
+					console.error('重新生成失败:', err);
+				}
+			} while (pending && !signal.aborted);
+		} finally {
+			building = false;
+		}
+	};
+	// 批量拷贝/逐个写区间文件会连续触发很多事件：安静 DEBOUNCE_MS 后再重建，
+	// 但从第一次变化算起最多等 DEBOUNCE_MAX_WAIT_MS，持续写入时也能定期刷新
+	let firstChangeAt = 0;
+	const onChange = () => {
+		if (signal.aborted) return;
+		const now = performance.now();
+		if (timer === undefined) firstChangeAt = now;
+		clearTimeout(timer);
+		const delay = Math.min(DEBOUNCE_MS, firstChangeAt + DEBOUNCE_MAX_WAIT_MS - now);
+		timer = setTimeout(() => {
+			timer = undefined;
+			rebuild();
+		}, Math.max(0, delay));
+	};
+
+	// 收到信号后关闭监听、取消待执行的重建；正在进行的 build 会写完，之后事件循环为空，进程自然退出
+	const stop = () => {
+		console.log('停止监听');
+		controller.abort();
+		clearTimeout(timer);
+	};
+	process.once('SIGINT', stop);
+	process.once('SIGTERM', stop);
+
+	// 首次构建和监听器挂载同时进行；构建期间到来的变化同样走 rebuild 的合并逻辑，不会漏掉
+	rebuild(true);
+
+	if (!isNetworkFs(DATA_DIR)) {
+		try {
+			await watchWithEvents(onChange, signal);
+			console.log('正在监听数据目录:', DATA_DIR);
+			return;
+		} catch (err) {
+			console.warn('文件事件监听不可用，改为轮询:', err);
+		}
+	}
+	watchWithPolling(onChange, signal).catch((err) => console.error('轮询监听失败:', err));
+	console.log(`正在轮询数据目录 (每 ${POLL_INTERVAL_MS / 1000} 秒):`, DATA_DIR);
+}
+
+async function main() {
+	if (!WATCH) {
+		await build();
+		return;
+	}
+	// 监听模式下启动前只确认数据目录存在，完整扫描放到 watch 里和监听器挂载重叠进行
+	try {
+		await fs.promises.access(DATA_DIR);
+	} catch {
+		await build(null);
+		console.warn('数据目录不存在，无法监听:', DATA_DIR);
+		return;
+	}
+	await watch();
+}
 
+main().catch((err) => {
+	console.error('数据聚合失败:', err);
+	process.exitCode = 1;
+});